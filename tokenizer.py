@@ -14,13 +14,35 @@ Usage:
 """
 
 import argparse
+import hashlib
+import http.client
 import json
+import mmap
+import multiprocessing
 import os
+import queue
 import shutil
+import sqlite3
+import subprocess
 import sys
+import tarfile
 import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from itertools import islice
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+# Let the Rust tokenizer parallelize batch encoding internally. This has to be
+# set before transformers/tokenizers are imported to take effect.
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "true")
 
 try:
     from transformers import GPT2TokenizerFast
@@ -31,18 +53,422 @@ except ImportError:
 
 try:
     from tokenizers import Tokenizer
-    from tokenizers.models import BPE
-    from tokenizers.pre_tokenizers import Whitespace
     HAS_TOKENIZERS = True
 except ImportError:
     HAS_TOKENIZERS = False
 
 try:
-    import git
-    HAS_GIT = True
+    import tiktoken
+    HAS_TIKTOKEN = True
+except ImportError:
+    HAS_TIKTOKEN = False
+
+try:
+    from blake3 import blake3
+    HAS_BLAKE3 = True
+except ImportError:
+    HAS_BLAKE3 = False
+
+try:
+    import orjson
+    HAS_ORJSON = True
 except ImportError:
-    HAS_GIT = False
-    print("Warning: GitPython not found. Repository cloning will not work.")
+    HAS_ORJSON = False
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+# Number of files read and handed to the tokenizer per batch; larger batches keep
+# more cores busy in the Rust tokenizer
+BATCH_SIZE = 256
+
+# Maximum number of characters encoded in a single tokenizer call. The encodings
+# of a call are held in memory together and take far more space than the text.
+ENCODE_BATCH_CHARS = 8 << 20
+
+# Number of threads reading files ahead of the tokenizer
+READ_WORKERS = 16
+
+# Number of loaded batches queued ahead of the tokenizer by the producer thread
+PREFETCH_BATCHES = 4
+
+# Files larger than this are streamed through the tokenizer in chunks instead of
+# being read whole into a batch
+STREAM_THRESHOLD_BYTES = 1 << 20
+
+# Number of characters read per chunk when streaming a large file
+STREAM_CHUNK_SIZE = 256 * 1024
+
+# Files at least this large are memory-mapped instead of copied into a bytes buffer;
+# below it the mmap setup cost outweighs the saved copy
+MMAP_THRESHOLD_BYTES = 16 * 1024
+
+# Files larger than this are assumed to be generated or embedded assets and are skipped
+MAX_FILE_BYTES = 4 << 20
+
+# Number of leading bytes inspected to detect binary and generated files
+SNIFF_BYTES = 4096
+
+# File name patterns of common code generators (Kubernetes deepcopy and friends,
+# protoc, grpc-gateway and stringer), skipped without being read
+GENERATED_NAME_PREFIXES = ('zz_generated',)
+GENERATED_NAME_SUFFIXES = ('.pb.go', '.pb.gw.go', '_string.go')
+
+# Reasons for skipping files without tokenizing them, as counted in results['skipped']
+SKIP_REASONS = ('empty', 'too_large', 'generated', 'binary')
+
+# In approximate mode, bytes of each file type tokenized exactly to calibrate the
+# bytes-per-token ratio used to estimate all other files from their size
+APPROXIMATE_SAMPLE_BYTES = 1 << 20
+
+# Typical GPT-2 bytes per token, used in approximate mode when no file of a type could
+# be tokenized for calibration. Types without their own ratio use the one for code.
+DEFAULT_BYTES_PER_TOKEN = 3.5
+_DEFAULT_BYTES_PER_TOKEN = {'.md': 3.8}
+
+# Number of per-file records serialized at a time when writing JSON output
+JSON_RECORD_CHUNK = 10_000
+
+# Maximum number of content digests whose token counts are kept in memory
+TOKEN_COUNT_MEMO_LIMIT = 500_000
+
+# Maximum number of repositories being cloned ahead of tokenization
+CLONE_WORKERS = 8
+
+# Seconds to wait for data from GitHub when downloading a repository tarball
+TARBALL_TIMEOUT = 60
+
+# Location of the persistent token count cache
+CACHE_DIR = Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache') / 'tokenmetry'
+TOKEN_CACHE_PATH = CACHE_DIR / 'token_counts.sqlite'
+
+# Token counts not used for this many days are evicted from the persistent cache, and
+# beyond TOKEN_CACHE_MAX_ROWS counts the least recently used ones are evicted as well
+TOKEN_CACHE_MAX_IDLE_DAYS = 30
+TOKEN_CACHE_MAX_ROWS = 1_000_000
+
+# Version of the counting rules applied on top of the tokenizer (e.g. how special
+# tokens in the text are counted). It is part of the token count cache version, so
+# bump it whenever counts for the same content and tokenizer would change.
+TOKEN_COUNT_RULES_VERSION = 1
+
+# Serialized GPT-2 tokenizer, saved on the first load so later runs skip from_pretrained()
+GPT2_TOKENIZER_PATH = CACHE_DIR / 'gpt2-tokenizer.json'
+
+# Token counts by content digest seen so far in this process, shared by all
+# directories and repositories so duplicated files (license headers, copied docs,
+# generated code) are only tokenized once per run. There is one memo per tokenizer,
+# keyed by its id and kept along with the tokenizer so the id is never reused.
+_token_count_memos: Dict[int, Tuple[object, Dict[bytes, int]]] = {}
+
+# Whether this process has encoded with the Rust tokenizer, which starts its thread
+# pool; children forked afterwards must not use that pool (see create_worker_pool())
+_tokenizer_parallelism_used = False
+
+# The GPT-2 tokenizer of this process, loaded once by load_gpt2_tokenizer()
+_gpt2_tokenizer = None
+
+# Number of threads tiktoken encodes batches with in this process; None for one per CPU
+_encode_threads: Optional[int] = None
+
+# Tokenizer and token count cache of a worker process, set up by _init_worker()
+_worker_tokenizer = None
+_worker_cache = None
+
+# File extensions that are tokenized, in reporting order. Their positions double as
+# small integer codes for the per-file extension column.
+_EXTENSIONS_BY_CODE = ('.go', '.md', '.rs', '.sol')
+_SOURCE_EXTENSIONS = frozenset(_EXTENSIONS_BY_CODE)
+_EXTENSION_CODES = {extension: code for code, extension in enumerate(_EXTENSIONS_BY_CODE)}
+
+# Names of directories that hold vendored, generated or test-fixture code rather than
+# first-party sources and are not descended into by default (see --exclude-dirs)
+DEFAULT_EXCLUDED_DIRS = frozenset(('.git', 'build', 'dist', 'node_modules', 'testdata', 'third_party', 'vendor'))
+
+class TokenCountCache:
+    """
+    Persistent cache of token counts keyed by file content digest, stored in SQLite.
+    
+    Files whose content is unchanged since a previous run are looked up instead of
+    being tokenized again.
+    
+    The counts are only valid for the version they were computed with (see
+    token_cache_version()), which is stored alongside them. Opening the cache with a
+    different version discards the stored counts.
+    
+    Every count records the day it was last stored or looked up, so prune() can
+    evict the least recently used ones and keep the cache from growing forever.
+    
+    The database uses write-ahead logging, so worker processes can read while
+    another one commits, and commits don't wait for an fsync of the database.
+    """
+    
+    # Stay below SQLite's limit on bound parameters per statement
+    _MAX_QUERY_PARAMS = 500
+    
+    def __init__(self, path: Path, version: str):
+        self.path = Path(path)
+        self.version = version
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(str(self.path), timeout=30)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        # With WAL, NORMAL only syncs at checkpoints; a crash can lose the latest
+        # commits but never corrupts the cache
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        columns = {row[1] for row in self._connection.execute('PRAGMA table_info(token_counts)')}
+        if columns and 'last_used' not in columns:
+            # Counts cached before last use was recorded can't be evicted in order
+            self._connection.execute('DROP TABLE token_counts')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS token_counts '
+            '(hash BLOB PRIMARY KEY, tokens INTEGER NOT NULL, last_used INTEGER NOT NULL)'
+        )
+        self._connection.execute('CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        stored_version = self._connection.execute("SELECT value FROM metadata WHERE key = 'version'").fetchone()
+        if stored_version is None or stored_version[0] != version:
+            self._connection.execute('DELETE FROM token_counts')
+            self._connection.execute("INSERT OR REPLACE INTO metadata (key, value) VALUES ('version', ?)", (version,))
+        self._connection.commit()
+    
+    @staticmethod
+    def _today() -> int:
+        return int(time.time()) // 86400
+    
+    def get_many(self, digests: List[bytes]) -> Dict[bytes, int]:
+        """Return the cached token counts for those of the given digests that are known, marking them used."""
+        found = {}
+        today = self._today()
+        for start in range(0, len(digests), self._MAX_QUERY_PARAMS):
+            chunk = digests[start:start + self._MAX_QUERY_PARAMS]
+            placeholders = ','.join('?' * len(chunk))
+            found.update(self._connection.execute(
+                f'SELECT hash, tokens FROM token_counts WHERE hash IN ({placeholders})', chunk
+            ))
+            # Only counts not yet used today are written
+            self._connection.execute(
+                f'UPDATE token_counts SET last_used = ? WHERE last_used < ? AND hash IN ({placeholders})',
+                (today, today, *chunk)
+            )
+        self._connection.commit()
+        return found
+    
+    def put_many(self, token_counts: Dict[bytes, int]):
+        """Store token counts by digest and commit them."""
+        if token_counts:
+            today = self._today()
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO token_counts (hash, tokens, last_used) VALUES (?, ?, ?)',
+                ((digest, token_count, today) for digest, token_count in token_counts.items())
+            )
+            self._connection.commit()
+    
+    def prune(self, max_idle_days: int = TOKEN_CACHE_MAX_IDLE_DAYS, max_rows: int = TOKEN_CACHE_MAX_ROWS):
+        """
+        Evict token counts not used within max_idle_days, and the least recently used
+        counts beyond max_rows.
+        """
+        self._connection.execute('DELETE FROM token_counts WHERE last_used < ?', (self._today() - max_idle_days,))
+        excess = self._connection.execute('SELECT COUNT(*) FROM token_counts').fetchone()[0] - max_rows
+        if excess > 0:
+            self._connection.execute(
+                'DELETE FROM token_counts WHERE hash IN (SELECT hash FROM token_counts ORDER BY last_used LIMIT ?)',
+                (excess,)
+            )
+        self._connection.commit()
+    
+    def close(self):
+        self._connection.close()
+
+
+class FileRecords:
+    """
+    Per-file results of a directory, stored column-wise.
+    
+    Paths, extension codes and token counts are kept in parallel columns, the latter
+    two in compact arrays, instead of one dict per file. The familiar
+    {'path', 'extension', 'tokens'} dicts are only built while iterating, e.g. when
+    the results are serialized.
+    """
+    
+    def __init__(self):
+        self.paths = []
+        self.extension_codes = array('B')
+        self.tokens = array('I')
+    
+    def append(self, path: str, extension: str, token_count: int):
+        self.paths.append(path)
+        self.extension_codes.append(_EXTENSION_CODES[extension])
+        self.tokens.append(token_count)
+    
+    def totals_by_extension(self) -> Dict[str, Dict[str, int]]:
+        """Sum up the number of files and tokens per extension."""
+        if HAS_NUMPY and self.tokens:
+            codes = np.frombuffer(self.extension_codes, dtype=np.uint8)
+            tokens = np.frombuffer(self.tokens, dtype=f'u{self.tokens.itemsize}')
+            files = np.bincount(codes, minlength=len(_EXTENSIONS_BY_CODE)).tolist()
+            # One weighted pass for all extensions; the float64 sums are exact below 2**53 tokens
+            token_sums = [
+                int(total) for total in np.bincount(codes, weights=tokens, minlength=len(_EXTENSIONS_BY_CODE))
+            ]
+        else:
+            files = [0] * len(_EXTENSIONS_BY_CODE)
+            token_sums = [0] * len(_EXTENSIONS_BY_CODE)
+            for code, token_count in zip(self.extension_codes, self.tokens):
+                files[code] += 1
+                token_sums[code] += token_count
+        
+        return {
+            extension: {'files': files[code], 'tokens': token_sums[code]}
+            for code, extension in enumerate(_EXTENSIONS_BY_CODE)
+        }
+    
+    def __len__(self):
+        return len(self.paths)
+    
+    def __iter__(self):
+        for path, code, token_count in zip(self.paths, self.extension_codes, self.tokens):
+            yield {'path': path, 'extension': _EXTENSIONS_BY_CODE[code], 'tokens': token_count}
+
+
+def _json_default(obj):
+    """Serialize objects the JSON encoders don't handle natively."""
+    if isinstance(obj, FileRecords):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _write_file_records_json(f, records: FileRecords, indent: bytes):
+    """
+    Write per-file records as an indented JSON array with orjson, a chunk at a time.
+    
+    Args:
+        f: Binary file to write to
+        records: The records to write
+        indent: Indentation of the line the array starts on
+    """
+    if not records:
+        f.write(b'[]')
+        return
+    
+    f.write(b'[\n')
+    records = iter(records)
+    separator = b''
+    while True:
+        chunk = list(islice(records, JSON_RECORD_CHUNK))
+        if not chunk:
+            break
+        # Serialize the chunk as a list without its brackets and indent its items
+        # to the nesting depth of the array
+        encoded = orjson.dumps(chunk, option=orjson.OPT_INDENT_2)[2:-2]
+        f.write(separator + indent + encoded.replace(b'\n', b'\n' + indent))
+        separator = b',\n'
+    f.write(b'\n' + indent + b']')
+
+
+def write_json(file_path, data):
+    """
+    Write data to a file as indented JSON, using orjson when it is installed.
+    
+    With orjson, FileRecords values of a top-level dict are serialized and written
+    JSON_RECORD_CHUNK records at a time, so neither all per-file dicts nor the whole
+    document are held in memory at once.
+    """
+    if HAS_ORJSON:
+        # Serialize everything else with unique placeholder strings in place of the
+        # records, then write the records where their placeholders ended up
+        document = data
+        placeholders = {}
+        if isinstance(data, dict):
+            document = dict(data)
+            for key, value in data.items():
+                if isinstance(value, FileRecords):
+                    placeholder = uuid.uuid4().hex
+                    document[key] = placeholder
+                    placeholders[orjson.dumps(placeholder)] = value
+        encoded = orjson.dumps(document, default=_json_default, option=orjson.OPT_INDENT_2)
+        
+        with open(file_path, 'wb') as f:
+            position = 0
+            for start, placeholder, records in sorted(
+                (encoded.index(placeholder), placeholder, records) for placeholder, records in placeholders.items()
+            ):
+                line_start = encoded.rfind(b'\n', 0, start) + 1
+                line = encoded[line_start:start]
+                f.write(encoded[position:start])
+                _write_file_records_json(f, records, line[:len(line) - len(line.lstrip(b' '))])
+                position = start + len(placeholder)
+            f.write(encoded[position:])
+    else:
+        with open(file_path, 'w') as f:
+            json.dump(data, f, indent=2, default=_json_default)
+
+
+def write_ndjson(file_path, header: Dict, records):
+    """
+    Write a header object followed by one JSON object per record, one per line.
+    
+    Every line is serialized on its own, so memory use stays flat in the number of
+    records instead of holding the whole document as one string.
+    """
+    if HAS_ORJSON:
+        with open(file_path, 'wb') as f:
+            f.write(orjson.dumps(header) + b'\n')
+            for record in records:
+                f.write(orjson.dumps(record) + b'\n')
+    else:
+        with open(file_path, 'w') as f:
+            f.write(json.dumps(header) + '\n')
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+
+
+def write_parquet(file_path, results: Dict):
+    """
+    Write the per-file results of a directory or repository as a Parquet table.
+    
+    The table has path, extension and tokens columns, built from the FileRecords
+    columns without going through per-file dicts; extensions are dictionary-encoded
+    from their codes. The remaining results (totals, mode, filters, ...) are stored
+    as JSON under the b'tokenmetry' key of the schema metadata.
+    
+    Args:
+        file_path: Path of the Parquet file to write
+        results: Results of process_directory() or process_repository()
+    """
+    if not HAS_PYARROW:
+        raise ImportError("pyarrow is required for Parquet output. Please install it.")
+    
+    files = results['files']
+    token_type = pa.uint32() if files.tokens.itemsize == 4 else pa.uint64()
+    table = pa.table({
+        'path': pa.array(files.paths, type=pa.string()),
+        'extension': pa.DictionaryArray.from_arrays(
+            pa.Array.from_buffers(pa.uint8(), len(files), [None, pa.py_buffer(files.extension_codes)]),
+            pa.array(_EXTENSIONS_BY_CODE, type=pa.string())
+        ),
+        'tokens': pa.Array.from_buffers(token_type, len(files), [None, pa.py_buffer(files.tokens)]),
+    })
+    summary = {key: value for key, value in results.items() if key != 'files'}
+    pq.write_table(table.replace_schema_metadata({'tokenmetry': json.dumps(summary)}), file_path)
+
+
+def write_results(file_path: str, results: Dict):
+    """Write the results of a directory or repository as Parquet if file_path ends in .parquet, else as JSON."""
+    if file_path.endswith('.parquet'):
+        write_parquet(file_path, results)
+    else:
+        write_json(file_path, results)
+
 
 def load_repositories_from_file(file_path: str) -> List[str]:
     """
@@ -71,29 +497,671 @@ def load_repositories_from_file(file_path: str) -> List[str]:
     return repos
 
 
+def _save_gpt2_tokenizer(tokenizer):
+    """Save a GPT-2 Rust tokenizer to GPT2_TOKENIZER_PATH for later runs."""
+    try:
+        GPT2_TOKENIZER_PATH.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so concurrent runs never read a partial file
+        temp_path = GPT2_TOKENIZER_PATH.with_name(f"{GPT2_TOKENIZER_PATH.name}.{os.getpid()}.tmp")
+        tokenizer.save(str(temp_path))
+        os.replace(temp_path, GPT2_TOKENIZER_PATH)
+    except Exception as e:
+        print(f"Warning: Could not save tokenizer to {GPT2_TOKENIZER_PATH}: {e}")
+
+
 def load_gpt2_tokenizer():
-    """Load GPT-2 tokenizer if transformers is available."""
-    if HAS_TRANSFORMERS:
-        return GPT2TokenizerFast.from_pretrained('gpt2')
-    elif HAS_TOKENIZERS:
-        # Fallback: create a simple BPE tokenizer
-        tokenizer = Tokenizer(BPE(unk_token="<unk>"))
-        tokenizer.pre_tokenizer = Whitespace()
-        return tokenizer
+    """
+    Load the GPT-2 tokenizer.
+    
+    tiktoken's GPT-2 encoding is preferred when tiktoken is installed: it has the
+    same vocabulary and merges, but encodes several times faster. Its encoding files
+    are downloaded once to CACHE_DIR.
+    
+    Otherwise, the first load goes through transformers and saves the Rust tokenizer
+    to GPT2_TOKENIZER_PATH. Later loads read that single JSON file directly, which is
+    much faster than from_pretrained() parsing vocab.json and merges.txt.
+    
+    The tokenizer is loaded once per process; later calls return the same instance.
+    It is meant to be created once in main() and passed down to every directory and
+    repository that is processed, so its caches carry over between them.
+    
+    Returns:
+        The `tiktoken.Encoding` or Rust `tokenizers.Tokenizer` of GPT-2
+    
+    Raises:
+        ImportError: If neither a saved tokenizer nor transformers is available
+    """
+    global _gpt2_tokenizer
+    if _gpt2_tokenizer is not None:
+        return _gpt2_tokenizer
+    
+    if HAS_TIKTOKEN:
+        os.environ.setdefault('TIKTOKEN_CACHE_DIR', str(CACHE_DIR / 'tiktoken'))
+        try:
+            _gpt2_tokenizer = tiktoken.get_encoding('gpt2')
+            return _gpt2_tokenizer
+        except Exception as e:
+            print(f"Warning: Could not load the tiktoken GPT-2 encoding: {e}")
+    
+    tokenizer = None
+    if HAS_TOKENIZERS and GPT2_TOKENIZER_PATH.is_file():
+        try:
+            tokenizer = Tokenizer.from_file(str(GPT2_TOKENIZER_PATH))
+        except Exception as e:
+            print(f"Warning: Could not load cached tokenizer {GPT2_TOKENIZER_PATH}: {e}")
+    
+    if tokenizer is None and HAS_TRANSFORMERS:
+        tokenizer = GPT2TokenizerFast.from_pretrained('gpt2').backend_tokenizer
+        _save_gpt2_tokenizer(tokenizer)
+    
+    if tokenizer is None:
+        # Any other tokenizer would silently produce different counts
+        raise ImportError(
+            f"The GPT-2 tokenizer could not be loaded from {GPT2_TOKENIZER_PATH}. Please install transformers."
+        )
+    
+    # Only token ids are needed for counting, so make sure the backend
+    # never pads or truncates encodings
+    tokenizer.no_padding()
+    tokenizer.no_truncation()
+    _gpt2_tokenizer = tokenizer
+    return tokenizer
+
+
+def get_backend_tokenizer(tokenizer):
+    """
+    Return the underlying Rust `tokenizers.Tokenizer` for a tokenizer instance.
+    
+    The transformers wrapper adds Python-side post-processing (attention masks,
+    special tokens, tensors) that is not needed when only counting tokens.
+    """
+    return getattr(tokenizer, 'backend_tokenizer', tokenizer)
+
+
+def token_cache_version(tokenizer) -> str:
+    """
+    Identify the tokenizer and counting rules that token counts are computed with.
+    
+    A Rust tokenizer is identified by a digest of its serialized definition, so a
+    changed or broken saved tokenizer never shares cached counts with the real one.
+    tiktoken can't serialize an encoding, so it is identified by the encoding name
+    and the tiktoken release, which pins the encoding files it downloads.
+    
+    Returns:
+        str: Version for TokenCountCache, "<tokenizer digest>/<TOKEN_COUNT_RULES_VERSION>"
+    """
+    backend = get_backend_tokenizer(tokenizer)
+    digest = hashlib.sha256()
+    if HAS_TIKTOKEN and isinstance(backend, tiktoken.Encoding):
+        digest.update(f"tiktoken\n{backend.name}\n{tiktoken.__version__}\n".encode())
     else:
-        raise ImportError("Neither transformers nor tokenizers library is available. Please install one of them.")
+        digest.update(backend.to_str().encode())
+    return f"{digest.hexdigest()[:16]}/{TOKEN_COUNT_RULES_VERSION}"
 
 
 def count_tokens_in_text(text: str, tokenizer) -> int:
     """Count tokens in the given text."""
-    if HAS_TRANSFORMERS:
-        # Using transformers tokenizer
-        tokens = tokenizer.encode(text)
-        return len(tokens)
+    return count_tokens_in_batch([text], tokenizer)[0]
+
+
+def count_tokens_in_batch(texts: List[str], tokenizer) -> List[int]:
+    """
+    Count tokens in each of the given texts using batched tokenizer calls.
+    
+    Texts are encoded in as few calls as possible, each covering at most
+    ENCODE_BATCH_CHARS characters (or a single longer text).
+    
+    A tiktoken encoding encodes each call's texts on a thread per CPU (or per
+    _encode_threads), releasing the GIL while it encodes. Special tokens such as
+    <|endoftext|> in the text count as one token, as with the Rust tokenizer.
+    """
+    global _tokenizer_parallelism_used
+    # Empty texts have no tokens and are not sent to the tokenizer
+    token_counts = [0] * len(texts)
+    indices = [index for index, text in enumerate(texts) if text]
+    backend = get_backend_tokenizer(tokenizer)
+    use_tiktoken = HAS_TIKTOKEN and isinstance(backend, tiktoken.Encoding)
+    if indices and not use_tiktoken:
+        # tiktoken's threads only live for one call, but the Rust thread pool stays
+        _tokenizer_parallelism_used = True
+    
+    start = 0
+    while start < len(indices):
+        end = start + 1
+        batch_chars = len(texts[indices[start]])
+        while end < len(indices) and batch_chars + len(texts[indices[end]]) <= ENCODE_BATCH_CHARS:
+            batch_chars += len(texts[indices[end]])
+            end += 1
+        
+        batch_indices = indices[start:end]
+        batch_texts = [texts[index] for index in batch_indices]
+        if not use_tiktoken:
+            token_ids = [encoding.ids for encoding in backend.encode_batch(batch_texts, add_special_tokens=False)]
+        elif len(batch_texts) == 1:
+            # Don't start threads for a single text
+            token_ids = [backend.encode(batch_texts[0], allowed_special='all')]
+        else:
+            token_ids = backend.encode_batch(batch_texts, num_threads=_encode_threads or _available_cpus(),
+                                             allowed_special='all')
+        for index, ids in zip(batch_indices, token_ids):
+            token_counts[index] = len(ids)
+        start = end
+    return token_counts
+
+
+def _decode_source(data) -> str:
+    """Decode UTF-8 file content with the same newline translation as a text-mode read."""
+    content = str(data, 'utf-8')
+    if '\r' in content:
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
+    return content
+
+
+def content_digest(data) -> bytes:
+    """Hash file content for the token count cache, using BLAKE3 when it is installed."""
+    if HAS_BLAKE3:
+        return blake3(data).digest()
+    return hashlib.sha256(data).digest()
+
+
+def content_skip_reason(head: bytes) -> Optional[str]:
+    """
+    Decide from the start of a walked file whether it is skipped without tokenizing it.
+    
+    Files with a NUL byte are binary, and Go's generated-code convention marks
+    generated files with a "// Code generated ... DO NOT EDIT." first line.
+    
+    Args:
+        head: The first SNIFF_BYTES bytes of the file
+        
+    Returns:
+        'binary' or 'generated' if the file is skipped, or None to count it
+    """
+    if b'\x00' in head:
+        return 'binary'
+    first_line = head.split(b'\n', 1)[0]
+    if first_line.startswith(b'// Code generated ') and b'DO NOT EDIT' in first_line:
+        return 'generated'
+    return None
+
+
+def load_source_file(file_path: str, stream_threshold: Optional[int] = None,
+                     sniff: bool = False) -> Union[Tuple[bytes, Optional[str]], str, None]:
+    """
+    Read and hash a source file.
+    
+    Files of at least MMAP_THRESHOLD_BYTES are memory-mapped, so they are hashed and
+    decoded directly from the page cache without an intermediate bytes copy. Smaller
+    files are read whole through an unbuffered file, skipping the copy through an
+    io.BufferedReader buffer.
+    
+    With sniff, binary and generated files (see content_skip_reason()) are skipped
+    without being hashed or decoded. Files are expected to have been selected by
+    size and name already (see skip_reason()).
+    
+    Args:
+        file_path: Path to the file
+        stream_threshold: If given, files larger than this many bytes are only hashed
+            and their content is left to be streamed through the tokenizer
+        sniff: Skip files whose content_skip_reason() is not None
+        
+    Returns:
+        tuple: (digest, content), where content is None for files that are to be
+            streamed, the content_skip_reason() of a skipped file, or None if the
+            file could not be read
+    """
+    try:
+        with open(file_path, 'rb', buffering=0) as f:
+            size = os.fstat(f.fileno()).st_size
+            if size >= MMAP_THRESHOLD_BYTES:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                data = f.read()
+            
+            try:
+                if sniff:
+                    reason = content_skip_reason(data[:SNIFF_BYTES])
+                    if reason is not None:
+                        return reason
+                digest = content_digest(data)
+                if stream_threshold is not None and size > stream_threshold:
+                    return digest, None
+                return digest, _decode_source(data)
+            finally:
+                if isinstance(data, mmap.mmap):
+                    data.close()
+    except (UnicodeDecodeError, PermissionError):
+        print(f"Warning: Could not read {file_path}. Skipping.")
+        return None
+
+
+def read_source_file(file_path: str) -> Optional[str]:
+    """
+    Read a source file as UTF-8 text.
+    
+    Returns:
+        The file content, or None if the file could not be read
+    """
+    loaded = load_source_file(file_path)
+    return loaded[1] if loaded is not None else None
+
+
+def _find_stream_split(text: str) -> int:
+    """
+    Find the last position at which text can be split without changing its token count.
+    
+    GPT-2 pre-tokenization never merges across a newline that sits between two
+    non-whitespace characters, so encoding the text in two pieces split right after
+    such a newline yields the same tokens as encoding it whole.
+    
+    Returns:
+        The split index, or 0 if there is no safe split point
+    """
+    end = len(text) - 1
+    while True:
+        index = text.rfind('\n', 0, end)
+        if index <= 0:
+            return 0
+        if not text[index - 1].isspace() and not text[index + 1].isspace():
+            return index + 1
+        end = index
+
+
+def count_tokens_streaming(file_path: str, tokenizer, chunk_size: int = STREAM_CHUNK_SIZE) -> int:
+    """
+    Count tokens in a large file without holding its full content or token ids in memory.
+    
+    The file is decoded incrementally and encoded in chunks that are split at safe
+    newline boundaries, so the count matches encoding the whole file at once.
+    """
+    token_count = 0
+    pending = ''
+    with open(file_path, 'r', encoding='utf-8') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            pending += chunk
+            split = _find_stream_split(pending)
+            if split:
+                token_count += count_tokens_in_text(pending[:split], tokenizer)
+                pending = pending[split:]
+    
+    if pending:
+        token_count += count_tokens_in_text(pending, tokenizer)
+    return token_count
+
+
+def skip_reason(name: str, size: int, max_file_bytes: int = MAX_FILE_BYTES) -> Optional[str]:
+    """
+    Decide from its name and size whether a source file is skipped without reading it.
+    
+    Empty files have no tokens, and files over max_file_bytes or named like the
+    output of a code generator are mostly generated code or embedded data that
+    would dominate tokenization time.
+    
+    Returns:
+        The reason for skipping the file, one of SKIP_REASONS, or None to count it
+    """
+    if size == 0:
+        return 'empty'
+    if size > max_file_bytes:
+        return 'too_large'
+    if name.startswith(GENERATED_NAME_PREFIXES) or name.endswith(GENERATED_NAME_SUFFIXES):
+        return 'generated'
+    return None
+
+
+def iter_source_files(directory: str, excluded_dirs: frozenset = DEFAULT_EXCLUDED_DIRS,
+                      max_file_bytes: int = MAX_FILE_BYTES, skipped: Optional[Dict[str, int]] = None,
+                      with_sizes: bool = False):
+    """
+    Recursively yield the paths of all supported source files in a directory.
+    
+    Subdirectories whose name is in excluded_dirs are skipped, and so are files for
+    which skip_reason() gives a reason. Those are counted by reason in skipped, if given.
+    
+    All extensions are collected in a single os.scandir() walk. DirEntry caches the
+    file type from the directory listing, so only files with a supported extension
+    are stat()ed, for their size. Symbolic links are not followed.
+    
+    Directories are walked from an explicit stack rather than by recursion, so each
+    path is yielded directly instead of through one generator per directory level,
+    and only one directory is held open at a time.
+    
+    Yields:
+        str: The path of each file, or (path, size) tuples with with_sizes
+    """
+    pending_dirs = [directory]
+    while pending_dirs:
+        try:
+            entries = os.scandir(pending_dirs.pop())
+        except PermissionError:
+            continue
+        
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in excluded_dirs:
+                        pending_dirs.append(entry.path)
+                else:
+                    name = entry.name
+                    dot = name.rfind('.')
+                    if dot > 0 and name[dot:] in _SOURCE_EXTENSIONS and entry.is_file(follow_symlinks=False):
+                        try:
+                            size = entry.stat(follow_symlinks=False).st_size
+                        except OSError:
+                            continue
+                        reason = skip_reason(name, size, max_file_bytes)
+                        if reason is None:
+                            yield (entry.path, size) if with_sizes else entry.path
+                        elif skipped is not None:
+                            skipped[reason] += 1
+
+
+def iter_file_batches(file_paths: Iterable[str], batch_size: int = BATCH_SIZE,
+                      skipped: Optional[Dict[str, int]] = None):
+    """
+    Read files in batches on a thread pool.
+    
+    The next batch is read while the caller tokenizes the current one, so file I/O
+    overlaps with tokenization instead of blocking it. file_paths is consumed one
+    batch at a time, so when it is a directory walk, the walk overlaps with the
+    reads as well.
+    
+    Files larger than STREAM_THRESHOLD_BYTES are only hashed; their content is None
+    so the caller can stream them through the tokenizer. Binary and generated files
+    are left out and counted by reason in skipped, if given.
+    
+    Yields:
+        list: (path, digest, content) of the successfully read files in each batch
+    """
+    file_paths = iter(file_paths)
+    
+    with ThreadPoolExecutor(max_workers=READ_WORKERS) as executor:
+        def submit_next_batch():
+            return [
+                (file_path, executor.submit(load_source_file, file_path, STREAM_THRESHOLD_BYTES, True))
+                for file_path in islice(file_paths, batch_size)
+            ]
+        
+        pending = submit_next_batch()
+        while pending:
+            current, pending = pending, submit_next_batch()
+            
+            loaded_files = []
+            for file_path, future in current:
+                loaded = future.result()
+                if isinstance(loaded, str):
+                    if skipped is not None:
+                        skipped[loaded] += 1
+                elif loaded is not None:
+                    loaded_files.append((file_path,) + loaded)
+            yield loaded_files
+
+
+def iter_prefetched(items: Iterable, max_pending: int = PREFETCH_BATCHES):
+    """
+    Iterate over items that a producer thread takes from items, up to max_pending ahead.
+    
+    Producing the items (walking, reading, downloading and decompressing files) then
+    runs while the caller tokenizes, which releases the GIL. Exceptions raised while
+    producing are re-raised to the caller. When the caller stops early, the producer
+    stops after its current item and closes items.
+    """
+    pending = queue.Queue(maxsize=max_pending)
+    stop = threading.Event()
+    done = object()
+    
+    def put(entry) -> bool:
+        # Give up once the caller has stopped, instead of blocking on a full queue
+        while not stop.is_set():
+            try:
+                pending.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+    
+    def produce():
+        try:
+            for item in items:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except BaseException as e:
+            put((done, e))
+        finally:
+            close = getattr(items, 'close', None)
+            if close is not None:
+                close()
+    
+    producer = threading.Thread(target=produce, name='tokenmetry-prefetch', daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, error = pending.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+        producer.join()
+
+
+def _token_count_memo(tokenizer) -> Dict[bytes, int]:
+    """Return the token counts by content digest memoized for a tokenizer."""
+    entry = _token_count_memos.get(id(tokenizer))
+    if entry is None:
+        entry = _token_count_memos[id(tokenizer)] = (tokenizer, {})
+    return entry[1]
+
+
+def count_tokens_in_loaded_batches(batches: Iterable[List[Tuple[str, bytes, Optional[str]]]], tokenizer,
+                                   cache: Optional[TokenCountCache] = None) -> List[Tuple[str, int]]:
+    """
+    Count tokens in batches of loaded files.
+    
+    Args:
+        batches: Lists of (path, digest, content) as yielded by iter_file_batches().
+            Files whose content is None are streamed from their path.
+        tokenizer: The tokenizer instance
+        cache: Optional persistent token count cache to look up and store counts in
+    
+    Returns:
+        list: (path, token_count) for every file that could be read
+    """
+    file_counts = []
+    seen = _token_count_memo(tokenizer)
+    for loaded_files in batches:
+        if cache is not None:
+            seen.update(cache.get_many(list({digest for _, digest, _ in loaded_files if digest not in seen})))
+        
+        to_encode = {}
+        for _, digest, content in loaded_files:
+            if digest not in seen and content is not None:
+                to_encode.setdefault(digest, content)
+        computed = dict(zip(to_encode, count_tokens_in_batch(list(to_encode.values()), tokenizer)))
+        seen.update(computed)
+        
+        for file_path, digest, _ in loaded_files:
+            token_count = seen.get(digest)
+            if token_count is None:
+                try:
+                    token_count = count_tokens_streaming(file_path, tokenizer)
+                except (UnicodeDecodeError, PermissionError):
+                    print(f"Warning: Could not read {file_path}. Skipping.")
+                    continue
+                seen[digest] = computed[digest] = token_count
+            file_counts.append((file_path, token_count))
+        
+        if cache is not None:
+            cache.put_many(computed)
+        if len(seen) > TOKEN_COUNT_MEMO_LIMIT:
+            seen.clear()
+    return file_counts
+
+
+def count_tokens_in_files(file_paths: Iterable[str], tokenizer, cache: Optional[TokenCountCache] = None,
+                          skipped: Optional[Dict[str, int]] = None) -> List[Tuple[str, int]]:
+    """
+    Count tokens in a list of files.
+    
+    The files are listed and read on a producer thread, which keeps up to
+    PREFETCH_BATCHES loaded batches queued while the calling thread tokenizes.
+    
+    Args:
+        file_paths: Paths of the files to tokenize
+        tokenizer: The tokenizer instance
+        cache: Optional persistent token count cache to look up and store counts in
+        skipped: Optional counts by reason to add binary and generated files to
+    
+    Returns:
+        list: (path, token_count) for every file that could be read and was not skipped
+    """
+    batches = iter_file_batches(file_paths, skipped=skipped)
+    return count_tokens_in_loaded_batches(iter_prefetched(batches), tokenizer, cache)
+
+
+def approximate_token_counts(files: Iterable[Tuple[str, int]], tokenizer,
+                             cache: Optional[TokenCountCache] = None,
+                             skipped: Optional[Dict[str, int]] = None) -> List[Tuple[str, int]]:
+    """
+    Estimate token counts from file sizes.
+    
+    For each extension, the first files are tokenized exactly until they cover
+    APPROXIMATE_SAMPLE_BYTES. The bytes-per-token ratio of that sample is then used to
+    estimate every other file of the extension from its size alone, without reading it.
+    Estimated files are not checked for binary or generated content.
+    
+    Args:
+        files: (path, size) of the non-empty files to count, as yielded by
+            iter_source_files() with with_sizes
+        tokenizer: The tokenizer instance
+        cache: Optional persistent token count cache for the sampled files
+        skipped: Optional counts by reason to add binary and generated sampled files to
+        
+    Returns:
+        list: (path, token_count) for every counted file; sampled files have exact counts
+    """
+    sample_sizes = {}
+    sampled_bytes = [0] * len(_EXTENSIONS_BY_CODE)
+    estimated_files = []
+    for file_path, size in files:
+        code = _EXTENSION_CODES[file_path[file_path.rfind('.'):]]
+        if sampled_bytes[code] < APPROXIMATE_SAMPLE_BYTES:
+            sampled_bytes[code] += size
+            sample_sizes[file_path] = size
+        else:
+            estimated_files.append((file_path, code, size))
+    
+    file_counts = count_tokens_in_files(sample_sizes, tokenizer, cache, skipped)
+    
+    sample_bytes = [0] * len(_EXTENSIONS_BY_CODE)
+    sample_tokens = [0] * len(_EXTENSIONS_BY_CODE)
+    for file_path, token_count in file_counts:
+        code = _EXTENSION_CODES[file_path[file_path.rfind('.'):]]
+        sample_bytes[code] += sample_sizes[file_path]
+        sample_tokens[code] += token_count
+    bytes_per_token = [
+        sample_bytes[code] / sample_tokens[code] if sample_tokens[code]
+        else _DEFAULT_BYTES_PER_TOKEN.get(extension, DEFAULT_BYTES_PER_TOKEN)
+        for code, extension in enumerate(_EXTENSIONS_BY_CODE)
+    ]
+    
+    file_counts.extend(
+        (file_path, max(1, round(size / bytes_per_token[code])))
+        for file_path, code, size in estimated_files
+    )
+    return file_counts
+
+
+def _pool_context():
+    """
+    Pick the multiprocessing context for tokenizer worker pools.
+    
+    Forked workers share the parent's loaded tokenizer copy-on-write instead of each
+    loading their own. fork is unavailable on Windows and unsafe on macOS, where the
+    platform default (spawn) is used instead.
+    
+    Returns:
+        The fork context, or None for the platform default
+    """
+    if sys.platform != 'darwin' and 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return None
+
+
+def _available_cpus() -> int:
+    """Return the number of CPUs this process may run on."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _init_worker(cache_path: Optional[Path] = None, tokenizer=None, threads: int = 1,
+                 cache_version: Optional[str] = None):
+    """
+    Set up the tokenizer and token count cache once per worker process.
+    
+    Args:
+        cache_path: Path of the token count cache to open, if any
+        tokenizer: The parent's tokenizer inherited through fork, or None to load one
+        threads: Number of threads the tokenizer may use in this worker. For the Rust
+            tokenizer, this has to be set before the worker first encodes, when the
+            pool is created.
+        cache_version: Version of the token count cache (see TokenCountCache)
+    """
+    global _worker_tokenizer, _worker_cache, _encode_threads
+    _encode_threads = threads
+    if threads > 1:
+        os.environ['RAYON_NUM_THREADS'] = str(threads)
+        os.environ['TOKENIZERS_PARALLELISM'] = 'true'
+    else:
+        os.environ['TOKENIZERS_PARALLELISM'] = 'false'
+    _worker_tokenizer = tokenizer if tokenizer is not None else load_gpt2_tokenizer()
+    _worker_cache = TokenCountCache(cache_path, cache_version) if cache_path is not None else None
+
+
+def create_worker_pool(workers: int, tokenizer, cache: Optional[TokenCountCache] = None) -> ProcessPoolExecutor:
+    """
+    Create a process pool for tokenizing shards of files with _count_tokens_in_shard().
+    
+    The worker processes are started right away, so that with fork they are created
+    before the caller starts any threads (e.g. background clones).
+    
+    The available CPUs are split evenly between the workers' tokenizer threads, so
+    the workers together neither leave cores idle nor oversubscribe them. Workers
+    forked after this process has used its own Rust thread pool can't use one and
+    encode single-threaded.
+    
+    Args:
+        workers: Number of worker processes
+        tokenizer: The tokenizer instance, shared with forked workers
+        cache: Optional persistent token count cache, opened again in every worker
+    """
+    cache_path = cache.path if cache is not None else None
+    cache_version = cache.version if cache is not None else None
+    context = _pool_context()
+    # Initializer arguments are inherited rather than pickled by forked workers,
+    # so they can take over the already loaded tokenizer
+    shared_tokenizer = tokenizer if context is not None else None
+    if context is not None and _tokenizer_parallelism_used:
+        worker_threads = 1
     else:
-        # Using basic tokenizer
-        encoding = tokenizer.encode(text)
-        return len(encoding.tokens)
+        worker_threads = max(1, _available_cpus() // workers)
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                   initargs=(cache_path, shared_tokenizer, worker_threads, cache_version))
+    executor.submit(int).result()
+    return executor
+
+
+def _count_tokens_in_shard(file_paths: List[str]) -> Tuple[List[Tuple[str, int]], Dict[str, int]]:
+    """Count tokens in a shard of files using the worker process' tokenizer, along with the files skipped by reason."""
+    skipped = dict.fromkeys(SKIP_REASONS, 0)
+    return count_tokens_in_files(file_paths, _worker_tokenizer, _worker_cache, skipped), skipped
 
 
 def count_tokens_in_file(file_path: str, tokenizer) -> tuple[int, str]:
@@ -103,34 +1171,45 @@ def count_tokens_in_file(file_path: str, tokenizer) -> tuple[int, str]:
     Returns:
         tuple: (token_count, file_extension)
     """
-    path = Path(file_path)
-    
-    if not path.exists():
-        raise FileNotFoundError(f"File not found: {file_path}")
-    
     # Check if it's a supported file type
-    extension = path.suffix.lower()
-    if extension not in ['.go', '.md', '.rs', '.sol']:
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension not in _SOURCE_EXTENSIONS:
         return 0, extension  # Skip unsupported files silently
     
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        token_count = count_tokens_in_text(content, tokenizer)
-        return token_count, extension
-        
-    except (UnicodeDecodeError, PermissionError):
-        print(f"Warning: Could not read {file_path}. Skipping.")
+        content = read_source_file(file_path)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"File not found: {file_path}") from None
+    if content is None:
         return 0, extension
+    
+    return count_tokens_in_text(content, tokenizer), extension
 
 
-def process_directory(directory_path: str, tokenizer) -> Dict:
+def process_directory(directory_path: str, tokenizer, workers: int = 1, cache: Optional[TokenCountCache] = None,
+                      executor: Optional[ProcessPoolExecutor] = None,
+                      excluded_dirs: frozenset = DEFAULT_EXCLUDED_DIRS, approximate: bool = False,
+                      max_file_bytes: int = MAX_FILE_BYTES) -> Dict:
     """
     Process all .go and .md files in a directory.
     
+    Args:
+        directory_path: Path to the directory to process
+        tokenizer: The tokenizer instance
+        workers: Number of worker processes to tokenize with. With more than one,
+            the files are sharded across a process pool. Where fork is used the
+            workers share this tokenizer, otherwise each loads its own.
+        cache: Optional persistent token count cache
+        executor: Optional pool from create_worker_pool() with this many workers to
+            use instead of creating one for this directory
+        excluded_dirs: Names of subdirectories not to descend into
+        approximate: Estimate most token counts from file sizes instead of tokenizing
+            every file (see approximate_token_counts())
+        max_file_bytes: Size above which files are skipped
+        
     Returns:
-        dict: Results with file counts and token counts by extension
+        dict: Results with file counts and token counts by extension, and the
+            number of files skipped by reason
     """
     path = Path(directory_path)
     
@@ -140,111 +1219,405 @@ def process_directory(directory_path: str, tokenizer) -> Dict:
     if not path.is_dir():
         raise ValueError(f"Path is not a directory: {directory_path}")
     
-    results = {
-        'directory': str(path),
+    results = _new_results(str(path), excluded_dirs, approximate, max_file_bytes)
+    
+    # Find all .go, .md, .rs, and .sol files in a single walk
+    source_files = iter_source_files(str(path), excluded_dirs, max_file_bytes, results['skipped'], approximate)
+    
+    if approximate:
+        # Only a small sample is tokenized, which is not worth sharding. The walk
+        # yields file sizes along with the paths, so no file is stat()ed twice.
+        file_counts = approximate_token_counts(source_files, tokenizer, cache, results['skipped'])
+    elif workers > 1:
+        # Sharding needs all paths up front
+        file_paths = list(source_files)
+        file_counts = []
+        if file_paths:
+            # Use a few shards per worker so one slow shard doesn't hold up the pool
+            shard_size = -(-len(file_paths) // (workers * 4))
+            shards = [file_paths[start:start + shard_size] for start in range(0, len(file_paths), shard_size)]
+            pool = nullcontext(executor) if executor is not None else create_worker_pool(workers, tokenizer, cache)
+            with pool as pool_executor:
+                for shard_counts, shard_skipped in pool_executor.map(_count_tokens_in_shard, shards):
+                    file_counts.extend(shard_counts)
+                    for reason, count in shard_skipped.items():
+                        results['skipped'][reason] += count
+    else:
+        # The walk feeds the file readers batch by batch as it goes
+        file_counts = count_tokens_in_files(source_files, tokenizer, cache, results['skipped'])
+    
+    # Walked paths all start with the directory path, which is sliced off
+    _add_file_counts(results, file_counts, len(os.path.join(str(path), '')))
+    return results
+
+
+def _new_results(directory: str, excluded_dirs: frozenset, approximate: bool = False,
+                 max_file_bytes: int = MAX_FILE_BYTES) -> Dict:
+    """Create the results of processing a directory; totals are filled in by _add_file_counts()."""
+    return {
+        'directory': directory,
         'total_files': 0,
         'total_tokens': 0,
-        'by_extension': {
-            '.go': {'files': 0, 'tokens': 0},
-            '.md': {'files': 0, 'tokens': 0},
-            '.rs': {'files': 0, 'tokens': 0},
-            '.sol': {'files': 0, 'tokens': 0}
-        },
-        'files': []
+        'by_extension': {},
+        'mode': 'approximate' if approximate else 'exact',
+        'filters': {'excluded_dirs': sorted(excluded_dirs), 'max_file_bytes': max_file_bytes},
+        'skipped': dict.fromkeys(SKIP_REASONS, 0),
+        'files': FileRecords()
     }
+
+
+def _add_file_counts(results: Dict, file_counts: Iterable[Tuple[str, int]], prefix_length: int):
+    """
+    Record per-file token counts in results and total them.
     
-    # Find all .go, .md, .rs, and .sol files
-    for pattern in ['**/*.go', '**/*.md', '**/*.rs', '**/*.sol']:
-        for file_path in path.glob(pattern):
-            if file_path.is_file():
-                token_count, extension = count_tokens_in_file(str(file_path), tokenizer)
+    Args:
+        results: Results from _new_results()
+        file_counts: (path, token_count) of the counted files
+        prefix_length: Length of the prefix shared by all paths, which is left out
+            of the recorded paths
+    """
+    # Paths all end in a supported extension, which is sliced off without further
+    # path parsing
+    files = results['files']
+    # Append straight to the columns through bound methods; this loop runs once per file
+    append_path = files.paths.append
+    append_extension_code = files.extension_codes.append
+    append_tokens = files.tokens.append
+    extension_codes = _EXTENSION_CODES
+    for file_path, token_count in file_counts:
+        if token_count > 0:  # Only count successfully processed files
+            # Store individual file info
+            append_path(file_path[prefix_length:])
+            append_extension_code(extension_codes[file_path[file_path.rfind('.'):]])
+            append_tokens(token_count)
+    
+    # Aggregate over the collected columns once instead of updating dicts per file
+    by_extension = files.totals_by_extension()
+    results['total_files'] = len(files)
+    results['total_tokens'] = sum(totals['tokens'] for totals in by_extension.values())
+    results['by_extension'] = by_extension
+
+
+def github_tarball_url(repo_url: str) -> Optional[str]:
+    """
+    Get the URL of the tarball of a GitHub repository's default branch.
+    
+    Returns:
+        The codeload.github.com URL, or None if repo_url is not an HTTPS GitHub repository URL
+    """
+    parsed = urllib.parse.urlparse(repo_url)
+    parts = parsed.path.strip('/').split('/')
+    if parsed.scheme != 'https' or parsed.hostname not in ('github.com', 'www.github.com') or len(parts) != 2:
+        return None
+    owner, name = parts
+    if name.endswith('.git'):
+        name = name[:-len('.git')]
+    return f"https://codeload.github.com/{owner}/{name}/tar.gz/HEAD"
+
+
+def download_tarball(tarball_url: str, destination: Path) -> Path:
+    """
+    Download a tarball into a directory without extracting it.
+    
+    Returns:
+        Path: Path to the downloaded tarball
+    """
+    print(f"Downloading {tarball_url}...")
+    tarball_path = destination / 'repository.tar.gz'
+    request = urllib.request.Request(tarball_url, headers={'User-Agent': 'tokenmetry'})
+    with urllib.request.urlopen(request, timeout=TARBALL_TIMEOUT) as response, open(tarball_path, 'wb') as f:
+        shutil.copyfileobj(response, f)
+    return tarball_path
+
+
+def iter_tarball_batches(tarball: Union[str, Path], excluded_dirs: frozenset = DEFAULT_EXCLUDED_DIRS,
+                         max_file_bytes: int = MAX_FILE_BYTES, skipped: Optional[Dict[str, int]] = None,
+                         batch_size: int = BATCH_SIZE):
+    """
+    Read the source files of a gzipped tarball in batches, without extracting them to disk.
+    
+    tarball is either the URL of a tarball to download, or the Path of a downloaded
+    one (see download_tarball()). The archive is decompressed and read as it streams
+    in. Files are selected like
+    iter_source_files() and iter_file_batches() do: by extension, outside of
+    excluded_dirs, by skip_reason() and by content_skip_reason(). Skipped files are
+    counted by reason in skipped, if given. Symbolic links are not followed.
+    
+    Yields:
+        list: (path, digest, content) of the files in each batch, with paths relative
+            to the repository root
+    """
+    if isinstance(tarball, Path):
+        source = open(tarball, 'rb')
+    else:
+        request = urllib.request.Request(tarball, headers={'User-Agent': 'tokenmetry'})
+        source = urllib.request.urlopen(request, timeout=TARBALL_TIMEOUT)
+    batch = []
+    with source:
+        with tarfile.open(fileobj=source, mode='r|gz') as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                
+                # Members are stored under a "<repo>-<commit>/" top-level directory
+                directories = member.name.split('/')[1:]
+                name = directories.pop()
+                dot = name.rfind('.')
+                if dot <= 0 or name[dot:] not in _SOURCE_EXTENSIONS or not excluded_dirs.isdisjoint(directories):
+                    continue
+                reason = skip_reason(name, member.size, max_file_bytes)
+                if reason is not None:
+                    if skipped is not None:
+                        skipped[reason] += 1
+                    continue
+                path = member.name.partition('/')[2]
+                
+                data = archive.extractfile(member).read()
+                reason = content_skip_reason(data[:SNIFF_BYTES])
+                if reason is not None:
+                    if skipped is not None:
+                        skipped[reason] += 1
+                    continue
+                try:
+                    content = _decode_source(data)
+                except UnicodeDecodeError:
+                    print(f"Warning: Could not read {path}. Skipping.")
+                    continue
                 
-                if token_count > 0:  # Only count successfully processed files
-                    results['total_files'] += 1
-                    results['total_tokens'] += token_count
-                    
-                    if extension in results['by_extension']:
-                        results['by_extension'][extension]['files'] += 1
-                        results['by_extension'][extension]['tokens'] += token_count
-                    
-                    # Store individual file info
-                    relative_path = file_path.relative_to(path)
-                    results['files'].append({
-                        'path': str(relative_path),
-                        'extension': extension,
-                        'tokens': token_count
-                    })
+                batch.append((path, content_digest(data), content))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+    if batch:
+        yield batch
+
+
+def process_tarball(tarball: Union[str, Path], tokenizer, cache: Optional[TokenCountCache] = None,
+                    excluded_dirs: frozenset = DEFAULT_EXCLUDED_DIRS, max_file_bytes: int = MAX_FILE_BYTES) -> Dict:
+    """
+    Process all source files in a tarball, tokenizing them in memory as they are read.
     
+    The tarball is decompressed, hashed and decoded on a producer thread while the
+    calling thread tokenizes.
+    
+    Args:
+        tarball: URL of a gzipped tarball with the repository under one top-level
+            directory, which is streamed, or the Path of a downloaded one
+        tokenizer: The tokenizer instance
+        cache: Optional persistent token count cache
+        excluded_dirs: Names of directories whose files are skipped
+        max_file_bytes: Size above which files are skipped
+    
+    Returns:
+        dict: Results in the same form as process_directory()
+    """
+    results = _new_results(str(tarball), excluded_dirs, max_file_bytes=max_file_bytes)
+    batches = iter_prefetched(iter_tarball_batches(tarball, excluded_dirs, max_file_bytes, results['skipped']))
+    file_counts = count_tokens_in_loaded_batches(batches, tokenizer, cache)
+    _add_file_counts(results, file_counts, 0)
     return results
 
 
-def clone_repository(repo_url: str, temp_dir: Path) -> Path:
+def _run_git(args: List[str]) -> subprocess.CompletedProcess:
+    """Run a git command, raising CalledProcessError with its captured output on failure."""
+    return subprocess.run(
+        ['git', *args],
+        check=True,
+        capture_output=True,
+        text=True,
+        # Fail instead of waiting for credentials on private or missing repositories
+        env={**os.environ, 'GIT_TERMINAL_PROMPT': '0'}
+    )
+
+
+def clone_repository(repo_url: str, temp_dir: Path, excluded_dirs: frozenset = DEFAULT_EXCLUDED_DIRS) -> Path:
     """
-    Clone a repository to a temporary directory.
+    Clone a repository to a temporary directory using the git command line.
+    
+    Only the tip of the default branch is fetched, and the clone is checked out
+    sparsely: only files with a tokenized extension outside of excluded_dirs are
+    written, and blobs are fetched lazily for just those files.
     
     Returns:
         Path: Path to the cloned repository
     """
-    if not HAS_GIT:
-        raise RuntimeError("GitPython is required for repository cloning. Install with: poetry add gitpython")
+    if shutil.which('git') is None:
+        raise RuntimeError("git is required for repository cloning. Please install it and make sure it is on PATH.")
     
     repo_name = repo_url.split('/')[-1].replace('.git', '')
     repo_path = temp_dir / repo_name
     
     print(f"Cloning {repo_url}...")
     try:
-        git.Repo.clone_from(repo_url, repo_path, depth=1)  # Shallow clone for speed
+        _run_git(['clone', '--depth=1', '--single-branch', '--no-tags', '--filter=blob:none', '--no-checkout',
+                  repo_url, str(repo_path)])
+    except subprocess.CalledProcessError as e:
+        print(f"Error cloning {repo_url}: {e.stderr.strip()}")
+        raise RuntimeError(f"git clone failed: {e.stderr.strip()}") from e
+    
+    sparse_patterns = [f'*{extension}' for extension in _EXTENSIONS_BY_CODE]
+    sparse_patterns += [f'!**/{name}/**' for name in sorted(excluded_dirs - {'.git'})]
+    try:
+        _run_git(['-C', str(repo_path), 'sparse-checkout', 'set', '--no-cone', *sparse_patterns])
+    except subprocess.CalledProcessError as e:
+        # Older git versions without non-cone sparse checkouts get a full checkout
+        print(f"Warning: Could not set up sparse checkout for {repo_url}: {e.stderr.strip()}")
+    
+    try:
+        _run_git(['-C', str(repo_path), 'rev-parse', '--verify', '--quiet', 'HEAD'])
+    except subprocess.CalledProcessError:
+        # An empty repository has no commit to check out
+        return repo_path
+    
+    try:
+        _run_git(['-C', str(repo_path), 'checkout'])
         return repo_path
-    except git.exc.GitCommandError as e:
-        print(f"Error cloning {repo_url}: {e}")
-        raise
+    except subprocess.CalledProcessError as e:
+        print(f"Error checking out {repo_url}: {e.stderr.strip()}")
+        raise RuntimeError(f"git checkout failed: {e.stderr.strip()}") from e
 
 
-def process_repository(repo_url: str, tokenizer) -> Dict:
+def iter_repository_clones(repo_urls: List[str], max_parallel: int = CLONE_WORKERS,
+                           excluded_dirs: frozenset = DEFAULT_EXCLUDED_DIRS, tarball: bool = False):
     """
-    Clone and process a single repository.
+    Clone repositories in the background, keeping up to max_parallel clones ahead of the caller.
+    
+    Cloning is network-bound, so the next repositories are fetched while the caller
+    tokenizes the current one.
+    
+    Args:
+        tarball: Download the tarballs of GitHub repositories (see download_tarball())
+            instead of cloning them
+    
+    Yields:
+        tuple: (repo_url, fetch_future, temp_dir) in the order of repo_urls. The future
+            resolves to the path of the clone or downloaded tarball inside temp_dir,
+            which the caller cleans up.
+    """
+    with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+        def start_clone(repo_url):
+            temp_dir = tempfile.TemporaryDirectory()
+            tarball_url = github_tarball_url(repo_url) if tarball else None
+            if tarball_url is not None:
+                return repo_url, executor.submit(download_tarball, tarball_url, Path(temp_dir.name)), temp_dir
+            return repo_url, executor.submit(clone_repository, repo_url, Path(temp_dir.name), excluded_dirs), temp_dir
+        
+        pending = deque()
+        for repo_url in repo_urls:
+            pending.append(start_clone(repo_url))
+            if len(pending) >= max_parallel:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
+
+
+def _process_repository_clone(repo_url: str, get_repo_path: Callable[[], Path], tokenizer, workers: int,
+                              cache: Optional[TokenCountCache], executor: Optional[ProcessPoolExecutor] = None,
+                              excluded_dirs: frozenset = DEFAULT_EXCLUDED_DIRS, approximate: bool = False,
+                              tarball: bool = False, max_file_bytes: int = MAX_FILE_BYTES,
+                              get_tarball: Optional[Callable[[], Path]] = None) -> Dict:
+    """
+    Process a repository once get_repo_path() has cloned it.
+    
+    With tarball, GitHub repositories are instead tokenized in memory from their
+    tarball (see process_tarball()): the one get_tarball() has downloaded if given,
+    or else one streamed from GitHub. If the download fails, this falls back to
+    get_repo_path().
     
     Returns:
         dict: Processing results for the repository
     """
     repo_name = repo_url.split('/')[-1].replace('.git', '')
     
-    with tempfile.TemporaryDirectory() as temp_dir:
-        temp_path = Path(temp_dir)
+    try:
+        results = None
+        tarball_url = github_tarball_url(repo_url) if tarball else None
+        if tarball_url is not None:
+            try:
+                if get_tarball is not None:
+                    tarball_source = get_tarball()
+                else:
+                    print(f"Downloading {tarball_url}...")
+                    tarball_source = tarball_url
+                results = process_tarball(tarball_source, tokenizer, cache, excluded_dirs, max_file_bytes)
+            except (OSError, http.client.HTTPException, tarfile.TarError) as e:
+                print(f"Warning: Could not download {tarball_url}: {e}. Cloning instead.")
         
-        try:
-            repo_path = clone_repository(repo_url, temp_path)
-            results = process_directory(str(repo_path), tokenizer)
-            
-            # Replace the temporary directory path with just the repo name
-            results['directory'] = repo_name
-            
-            # Add repository metadata
-            results['repository'] = {
-                'name': repo_name,
-                'url': repo_url
-            }
-            
-            return results
-            
-        except Exception as e:
-            print(f"✗ Failed to process {repo_name}: {e}")
-            return {
-                'repository': {'name': repo_name, 'url': repo_url},
-                'error': str(e),
-                'total_files': 0,
-                'total_tokens': 0
-            }
+        if results is None:
+            repo_path = get_repo_path()
+            results = process_directory(str(repo_path), tokenizer, workers, cache, executor, excluded_dirs, approximate,
+                                        max_file_bytes)
+        
+        # Replace the temporary directory path with just the repo name
+        results['directory'] = repo_name
+        
+        # Add repository metadata
+        results['repository'] = {
+            'name': repo_name,
+            'url': repo_url
+        }
+        
+        return results
+        
+    except Exception as e:
+        print(f"✗ Failed to process {repo_name}: {e}")
+        return {
+            'repository': {'name': repo_name, 'url': repo_url},
+            'error': str(e),
+            'total_files': 0,
+            'total_tokens': 0
+        }
+
+
+def process_repository(repo_url: str, tokenizer, workers: int = 1, cache: Optional[TokenCountCache] = None,
+                       excluded_dirs: frozenset = DEFAULT_EXCLUDED_DIRS, approximate: bool = False,
+                       tarball: bool = False, max_file_bytes: int = MAX_FILE_BYTES) -> Dict:
+    """
+    Clone and process a single repository.
+    
+    Args:
+        repo_url: Repository URL to clone
+        tokenizer: The tokenizer instance
+        workers: Number of worker processes to tokenize with
+        cache: Optional persistent token count cache
+        excluded_dirs: Names of directories to leave out of the checkout and the walk
+        approximate: Estimate most token counts from file sizes
+        tarball: Download GitHub repositories as a tarball instead of cloning them.
+            Ignored with approximate, which avoids reading most files.
+        max_file_bytes: Size above which files are skipped
+        
+    Returns:
+        dict: Processing results for the repository
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        return _process_repository_clone(
+            repo_url, lambda: clone_repository(repo_url, Path(temp_dir), excluded_dirs), tokenizer, workers, cache,
+            excluded_dirs=excluded_dirs, approximate=approximate, tarball=tarball and not approximate,
+            max_file_bytes=max_file_bytes
+        )
 
 
-def process_multiple_repositories(repo_urls: List[str], tokenizer, output_base_path: Path) -> Dict:
+def process_multiple_repositories(repo_urls: List[str], tokenizer, output_base_path: Path, workers: int = 1,
+                                  cache: Optional[TokenCountCache] = None,
+                                  excluded_dirs: frozenset = DEFAULT_EXCLUDED_DIRS, approximate: bool = False,
+                                  tarball: bool = False, max_file_bytes: int = MAX_FILE_BYTES) -> Dict:
     """
     Process multiple repositories, saving individual repo data and returning meta-index data.
     
+    All repositories are tokenized with the given tokenizer instance; it is never
+    reloaded per repository.
+    
     Args:
         repo_urls: List of repository URLs.
         tokenizer: The tokenizer instance.
         output_base_path: The base path where 'meta_index.json' and 'repository_data/' will be stored.
+        workers: Number of worker processes to tokenize each repository with.
+        cache: Optional persistent token count cache.
+        excluded_dirs: Names of directories to leave out of the checkouts and walks.
+        approximate: Estimate most token counts from file sizes.
+        tarball: Download GitHub repositories as tarballs instead of cloning them.
+            Ignored with approximate.
+        max_file_bytes: Size above which files are skipped.
         
     Returns:
         dict: Data for the meta_index.json file.
@@ -259,62 +1632,84 @@ def process_multiple_repositories(repo_urls: List[str], tokenizer, output_base_p
             'total_files_across_all_repos': 0,
             'total_tokens_across_all_repos': 0,
             'by_extension_across_all_repos': {
-                '.go': {'files': 0, 'tokens': 0},
-                '.md': {'files': 0, 'tokens': 0},
-                '.rs': {'files': 0, 'tokens': 0},
-                '.sol': {'files': 0, 'tokens': 0}
+                extension: {'files': 0, 'tokens': 0} for extension in _EXTENSIONS_BY_CODE
             }
         },
         'repositories': [] # List of summaries for each repo, pointing to their individual files
     }
     
-    for repo_url in repo_urls:
-        print(f"\nProcessing {repo_url}...")
-        # repo_results contains detailed file list for this specific repo
-        repo_results = process_repository(repo_url, tokenizer) 
-        
-        repo_name = repo_results.get('repository', {}).get('name', 'unknown_repo')
-        individual_repo_filename = f"{repo_name}.json"
-        individual_repo_filepath = repository_data_dir / individual_repo_filename
-        
-        if 'error' not in repo_results:
-            # Save detailed data for this specific repository
-            try:
-                with open(individual_repo_filepath, 'w') as f:
-                    json.dump(repo_results, f, indent=2)
-                print(f"  Detailed data saved to: {individual_repo_filepath}")
-            except Exception as e:
-                print(f"  Error saving detailed data for {repo_name}: {e}")
-                # Continue processing other repos, but mark this one as having an issue with saving
-                repo_results['error'] = repo_results.get('error', '') + f"; Failed to save individual JSON: {e}"
-
-        # Prepare summary for this repo to be included in meta_index.json
-        repo_summary_for_meta = {
-            'name': repo_name,
-            'url': repo_url,
-            'data_file': f"repository_data/{individual_repo_filename}", # Relative path for GitHub Pages
-            'total_files': repo_results.get('total_files', 0),
-            'total_tokens': repo_results.get('total_tokens', 0),
-            'by_extension': repo_results.get('by_extension', {}),
-            'error': repo_results.get('error', None)
-        }
-        meta_index_data['repositories'].append(repo_summary_for_meta)
-        
-        # Update overall summary in meta_index_data if processing was successful (error field is not present or empty)
-        if not repo_summary_for_meta['error']:
-            meta_index_data['summary']['successful_repositories_processed'] += 1
-            meta_index_data['summary']['total_files_across_all_repos'] += repo_summary_for_meta['total_files']
-            meta_index_data['summary']['total_tokens_across_all_repos'] += repo_summary_for_meta['total_tokens']
+    tarball = tarball and not approximate
+    # One worker pool is shared by all cloned repositories. It is created before the
+    # background clones start, so its processes are forked without other threads.
+    # Tarballs are tokenized in this process, so when every repository is downloaded
+    # as one, no pool is created; a repository whose download fails is then
+    # tokenized in this process too.
+    if tarball and all(github_tarball_url(repo_url) is not None for repo_url in repo_urls):
+        workers = 1
+    pool = create_worker_pool(workers, tokenizer, cache) if workers > 1 and not approximate else nullcontext()
+    with pool as executor:
+        # Later repositories are cloned or downloaded in the background while earlier
+        # ones are tokenized
+        for repo_url, fetch_future, temp_dir in iter_repository_clones(repo_urls, excluded_dirs=excluded_dirs,
+                                                                       tarball=tarball):
+            print(f"\nProcessing {repo_url}...")
+            get_tarball = None
+            if tarball and github_tarball_url(repo_url) is not None:
+                # Repositories downloaded as tarballs are only cloned if their download fails
+                get_tarball = fetch_future.result
+                def get_repo_path(repo_url=repo_url, temp_dir=temp_dir):
+                    return clone_repository(repo_url, Path(temp_dir.name), excluded_dirs)
+            else:
+                get_repo_path = fetch_future.result
+            # repo_results contains detailed file list for this specific repo
+            with temp_dir:
+                repo_results = _process_repository_clone(repo_url, get_repo_path, tokenizer, workers, cache,
+                                                         executor, excluded_dirs, approximate, tarball, max_file_bytes,
+                                                         get_tarball)
             
-            for ext, data in repo_summary_for_meta['by_extension'].items():
-                if ext in meta_index_data['summary']['by_extension_across_all_repos']:
-                    meta_index_data['summary']['by_extension_across_all_repos'][ext]['files'] += data.get('files', 0)
-                    meta_index_data['summary']['by_extension_across_all_repos'][ext]['tokens'] += data.get('tokens', 0)
+            repo_name = repo_results.get('repository', {}).get('name', 'unknown_repo')
+            individual_repo_filename = f"{repo_name}.ndjson"
+            individual_repo_filepath = repository_data_dir / individual_repo_filename
             
-            print(f"✓ {repo_name}: {repo_summary_for_meta['total_files']} files, {repo_summary_for_meta['total_tokens']} tokens")
-        else:
-            print(f"✗ {repo_name}: Processing encountered an error: {repo_summary_for_meta['error']}")
+            if 'error' not in repo_results:
+                # Save detailed data for this specific repository: a summary line followed
+                # by one line per file
+                try:
+                    header = {key: value for key, value in repo_results.items() if key != 'files'}
+                    write_ndjson(individual_repo_filepath, header, repo_results['files'])
+                    print(f"  Detailed data saved to: {individual_repo_filepath}")
+                except Exception as e:
+                    print(f"  Error saving detailed data for {repo_name}: {e}")
+                    # Continue processing other repos, but mark this one as having an issue with saving
+                    repo_results['error'] = repo_results.get('error', '') + f"; Failed to save individual NDJSON: {e}"
+
+            # Prepare summary for this repo to be included in meta_index.json
+            repo_summary_for_meta = {
+                'name': repo_name,
+                'url': repo_url,
+                'data_file': f"repository_data/{individual_repo_filename}", # Relative path for GitHub Pages
+                'total_files': repo_results.get('total_files', 0),
+                'total_tokens': repo_results.get('total_tokens', 0),
+                'by_extension': repo_results.get('by_extension', {}),
+                'error': repo_results.get('error', None)
+            }
+            meta_index_data['repositories'].append(repo_summary_for_meta)
             
+            # Update overall summary in meta_index_data if processing was successful (error field is not present or empty)
+            if not repo_summary_for_meta['error']:
+                meta_index_data['summary']['successful_repositories_processed'] += 1
+                meta_index_data['summary']['total_files_across_all_repos'] += repo_summary_for_meta['total_files']
+                meta_index_data['summary']['total_tokens_across_all_repos'] += repo_summary_for_meta['total_tokens']
+                
+                for ext, data in repo_summary_for_meta['by_extension'].items():
+                    if ext in meta_index_data['summary']['by_extension_across_all_repos']:
+                        meta_index_data['summary']['by_extension_across_all_repos'][ext]['files'] += data.get('files', 0)
+                        meta_index_data['summary']['by_extension_across_all_repos'][ext]['tokens'] += data.get('tokens', 0)
+                
+                print(f"✓ {repo_name}: {repo_summary_for_meta['total_files']} files, {repo_summary_for_meta['total_tokens']} tokens")
+            else:
+                print(f"✗ {repo_name}: Processing encountered an error: {repo_summary_for_meta['error']}")
+                
     return meta_index_data
 
 
@@ -328,14 +1723,42 @@ def main():
     group.add_argument('--text', '-t', help='Text string to tokenize')
     
     parser.add_argument('--repo-file', default='repos.txt', help='Path to file containing repository URLs (default: repos.txt)')
-    parser.add_argument('--output', '-o', help='Output JSON file path (optional)')
+    parser.add_argument('--output', '-o', help='Output JSON file path, or Parquet file path ending in .parquet (optional)')
     parser.add_argument('--verbose', '-v', action='store_true', help='Show detailed file-by-file results')
+    parser.add_argument('--workers', '-w', type=int, default=1, help='Number of processes to tokenize directories with (default: 1)')
+    parser.add_argument('--no-cache', action='store_true', help=f'Do not use the persistent token count cache in {CACHE_DIR}')
+    parser.add_argument('--exclude-dirs', default=','.join(sorted(DEFAULT_EXCLUDED_DIRS - {'.git'})),
+                        help='Comma-separated names of directories to skip; .git is always skipped '
+                             '(default: %(default)s)')
+    parser.add_argument('--approximate', action='store_true',
+                        help='Estimate token counts from file sizes, calibrated on a sample of each file type')
+    parser.add_argument('--max-file-bytes', type=int, default=MAX_FILE_BYTES,
+                        help='Skip files larger than this many bytes (default: %(default)s)')
+    parser.add_argument('--tarball', action='store_true',
+                        help='Download GitHub repositories as tarballs and tokenize them in memory instead of cloning them')
     
     args = parser.parse_args()
+    excluded_dirs = frozenset(name.strip() for name in args.exclude_dirs.split(',') if name.strip()) | {'.git'}
+    
+    if args.output and args.output.endswith('.parquet'):
+        if not (args.directory or args.repo):
+            print("Error: Parquet output is only supported with --directory and --repo.")
+            sys.exit(1)
+        if not HAS_PYARROW:
+            print("Error: pyarrow is required for Parquet output. Please install it.")
+            sys.exit(1)
     
     print("Loading tokenizer...")
     tokenizer = load_gpt2_tokenizer()
     
+    cache = None
+    if not args.no_cache and (args.directory or args.repo or args.celestia_repos):
+        try:
+            cache = TokenCountCache(TOKEN_CACHE_PATH, token_cache_version(tokenizer))
+            cache.prune()
+        except (OSError, sqlite3.Error) as e:
+            print(f"Warning: Could not open token count cache {TOKEN_CACHE_PATH}: {e}")
+    
     if args.file:
         try:
             token_count, extension = count_tokens_in_file(args.file, tokenizer)
@@ -348,7 +1771,8 @@ def main():
     
     elif args.directory:
         try:
-            results = process_directory(args.directory, tokenizer)
+            results = process_directory(args.directory, tokenizer, args.workers, cache, excluded_dirs=excluded_dirs,
+                                        approximate=args.approximate, max_file_bytes=args.max_file_bytes)
             print(f"\nDirectory: {results['directory']}")
             print(f"Total files: {results['total_files']}")
             print(f"Total tokens: {results['total_tokens']:,}")
@@ -356,6 +1780,8 @@ def main():
             print(f"Markdown files: {results['by_extension']['.md']['files']} files, {results['by_extension']['.md']['tokens']:,} tokens")
             print(f"Rust files: {results['by_extension']['.rs']['files']} files, {results['by_extension']['.rs']['tokens']:,} tokens")
             print(f"Solidity files: {results['by_extension']['.sol']['files']} files, {results['by_extension']['.sol']['tokens']:,} tokens")
+            print(f"Skipped files: {results['skipped']['empty']} empty, {results['skipped']['too_large']} too large, "
+                  f"{results['skipped']['generated']} generated, {results['skipped']['binary']} binary")
             
             if args.verbose:
                 print("\nFile details:")
@@ -363,8 +1789,7 @@ def main():
                     print(f"  {file_info['path']}: {file_info['tokens']} tokens")
             
             if args.output:
-                with open(args.output, 'w') as f:
-                    json.dump(results, f, indent=2)
+                write_results(args.output, results)
                 print(f"\nDetailed results saved to: {args.output}")
                 
         except (FileNotFoundError, ValueError) as e:
@@ -373,7 +1798,8 @@ def main():
     
     elif args.repo:
         try:
-            results = process_repository(args.repo, tokenizer)
+            results = process_repository(args.repo, tokenizer, args.workers, cache, excluded_dirs, args.approximate,
+                                         args.tarball, args.max_file_bytes)
             if 'error' in results:
                 print(f"Failed to process repository: {results['error']}")
                 sys.exit(1)
@@ -386,6 +1812,8 @@ def main():
             print(f"Markdown files: {results['by_extension']['.md']['files']} files, {results['by_extension']['.md']['tokens']:,} tokens")
             print(f"Rust files: {results['by_extension']['.rs']['files']} files, {results['by_extension']['.rs']['tokens']:,} tokens")
             print(f"Solidity files: {results['by_extension']['.sol']['files']} files, {results['by_extension']['.sol']['tokens']:,} tokens")
+            print(f"Skipped files: {results['skipped']['empty']} empty, {results['skipped']['too_large']} too large, "
+                  f"{results['skipped']['generated']} generated, {results['skipped']['binary']} binary")
             
             if args.verbose:
                 print("\nFile details:")
@@ -393,8 +1821,7 @@ def main():
                     print(f"  {file_info['path']}: {file_info['tokens']} tokens")
             
             if args.output:
-                with open(args.output, 'w') as f:
-                    json.dump(results, f, indent=2)
+                write_results(args.output, results)
                 print(f"\nDetailed results saved to: {args.output}")
                 
         except Exception as e:
@@ -417,11 +1844,12 @@ def main():
             output_base_dir = output_meta_index_path.parent
             output_base_dir.mkdir(parents=True, exist_ok=True)
 
-            meta_index_content = process_multiple_repositories(repo_urls, tokenizer, output_base_dir)
+            meta_index_content = process_multiple_repositories(repo_urls, tokenizer, output_base_dir, args.workers, cache,
+                                                               excluded_dirs, args.approximate, args.tarball,
+                                                               args.max_file_bytes)
             
             try:
-                with open(output_meta_index_path, 'w') as f:
-                    json.dump(meta_index_content, f, indent=2)
+                write_json(output_meta_index_path, meta_index_content)
                 print(f"\nMeta-index saved to: {output_meta_index_path}")
             except Exception as e:
                 print(f"Error saving meta-index to {output_meta_index_path}: {e}")